@@ -0,0 +1,262 @@
+# --------------------------------------------------------------------------------------
+# ファイル名: pyApiAtac_async.py
+# 概要: Python asyncioを使用したSOAP負荷テストクライアント。
+# 目的: リクエストごとにプロセスを生成せず、1プロセスのイベントループ上で
+#       多数のリクエストを同時に発行するために作成。
+#
+# 技術詳細: 標準ライブラリの asyncio.open_connection で HTTP/1.1 の POST を直接送信。
+#           接続先・テスト設定・SOAP XMLの組み立ては pyApiAtac_mp.py と共通。
+#
+# 作成者: Pekokana
+# 作成日: 2025-11-30
+# バージョン: 1.0.0
+# --------------------------------------------------------------------------------------
+# 実行方法：python pyApiAtac_async.py
+import asyncio
+import collections
+
+from pyApiAtac_mp import (
+    SERVICE_HOST,
+    SERVICE_PATH,
+    SERVICE_PORT,
+    SOAP_ACTION_HEADER,
+    SSL_CONTEXT,
+    BASE_PARAMETER_VALUE,
+    DURATION_SECONDS,
+    TARGET_RATE,
+    TARGET_INTERVAL,
+    SHUTDOWN_TIMEOUT,
+    VERBOSE,
+    build_soap_body,
+    make_request_id,
+    format_results,
+    logger,
+    record_result,
+    start_error_logging,
+)
+
+# --- asyncio設定 ---
+CONNECTION_LIMIT = 32             # 同時に張るTCP接続 (keep-alive) の本数
+PIPELINE_DEPTH = 8                # 1本の接続で応答を待たずに送信できるリクエスト数
+
+# リクエストヘッダーは Content-Length の値以外すべて共通のため、起動時に1度だけbytesとして組み立てておく
+_REQUEST_HEAD_PREFIX = (
+    f"POST {SERVICE_PATH} HTTP/1.1\r\n"
+    f"Host: {SERVICE_HOST}:{SERVICE_PORT}\r\n"
+    "Content-Type: text/xml; charset=utf-8\r\n"
+    f"SOAPAction: {SOAP_ACTION_HEADER}\r\n"
+    "Connection: keep-alive\r\n"
+    "Content-Length: "
+).encode('latin-1')
+
+
+async def _read_response(reader):
+    """
+    HTTPレスポンスのステータスコード・本文・接続を再利用できるかを読み込むヘルパー関数
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed before response.")
+    version, status, _ = status_line.split(None, 2)
+    status = int(status)
+    keep_alive = version == b"HTTP/1.1"
+
+    content_length = None
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            content_length = int(value.strip())
+        elif name == b"connection":
+            keep_alive = value.strip().lower() != b"close"
+
+    if content_length is None:
+        # 本文長が不明な場合は接続終了まで読み込むため、再利用できない
+        body = await reader.read()
+        keep_alive = False
+    else:
+        body = await reader.readexactly(content_length)
+    return status, body, keep_alive
+
+
+class PipelinedConnection:
+    """
+    1本のkeep-alive接続上で、前の応答を待たずに次のリクエストを送信する (HTTP/1.1パイプライン)
+    """
+
+    def __init__(self):
+        self.writer = None
+        self.in_flight = 0                            # 送信待ち・応答待ちのリクエスト数
+        self.pending = collections.deque()            # 応答待ちのFuture (送信順)
+        self.slots = asyncio.Semaphore(PIPELINE_DEPTH)
+        self._connect_lock = asyncio.Lock()
+        self._reader_task = None
+
+    async def _ensure_connected(self):
+        """未接続 (または切断済み) の場合に接続し、応答の受信タスクを起動する"""
+        async with self._connect_lock:
+            if self.writer is None:
+                # (asyncioはTCP接続の確立時にNagleアルゴリズムを無効化 (TCP_NODELAY) する)
+                reader, self.writer = await asyncio.open_connection(SERVICE_HOST, SERVICE_PORT, ssl=SSL_CONTEXT)
+                self.pending = collections.deque()
+                self._reader_task = asyncio.create_task(self._read_responses(reader, self.writer, self.pending))
+
+    async def _read_responses(self, reader, writer, pending):
+        """応答を受信した順に、送信順で並んだFutureへ結果を渡す受信タスク"""
+        try:
+            while True:
+                status, body, keep_alive = await _read_response(reader)
+                if not pending:
+                    raise ConnectionError("Unexpected response without request.")
+                future = pending.popleft()
+                if not future.done():
+                    future.set_result((status, body))
+                if not keep_alive:
+                    raise ConnectionError("Connection closed by server.")
+        except Exception as e:
+            # 切断・エラー時は応答待ちのリクエストをすべて失敗させ、次回のリクエストで再接続させる
+            while pending:
+                future = pending.popleft()
+                if not future.done():
+                    future.set_exception(e)
+            if self.writer is writer:
+                self.writer = None
+            writer.close()
+
+    async def request(self, data):
+        """リクエストを送信し、(ステータスコード, 本文) を返す"""
+        self.in_flight += 1
+        try:
+            async with self.slots:
+                await self._ensure_connected()
+                writer = self.writer
+                future = asyncio.get_running_loop().create_future()
+                self.pending.append(future)
+                try:
+                    writer.write(data)
+                    await writer.drain()
+                except Exception:
+                    future.cancel()
+                    raise
+                return await future
+        finally:
+            self.in_flight -= 1
+
+    def close(self):
+        """テスト終了時に接続を閉じる"""
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def _in_flight(connection):
+    """接続の割り当てに使用する、処理中のリクエスト数を返す関数"""
+    return connection.in_flight
+
+
+# コルーチンごとに実行する関数
+async def send_soap_request_async(request_count, connection):
+    """
+    SOAPサービスにリクエストを送信するコルーチン (標準ライブラリのみ使用)
+    結果は (結果区分, エラーメッセージ) のタプルで返す
+    """
+    # 1. 識別子の準備 (asyncioの場合は全リクエストが同一プロセスのため、PIDは共通)
+    request_id = make_request_id(request_count) # 例: b"P12345-R10"
+
+    # 2. パラメータ値の準備
+    unique_param = BASE_PARAMETER_VALUE + request_count
+
+    # 3. SOAP XMLの組み立て (識別子は<requestId>タグとしてXMLに埋め込む)
+    soap_body = build_soap_body(unique_param, request_id)
+
+    # 4. リクエストの組み立て (固定のヘッダー + Content-Length + 本文)
+    request_data = b"".join((_REQUEST_HEAD_PREFIX, str(len(soap_body)).encode('ascii'), b"\r\n\r\n", soap_body))
+
+    try:
+        # 5. リクエストの送信とレスポンスの受信 (割り当てられた接続上でパイプライン送信)
+        status, response_data = await connection.request(request_data)
+
+        # 6. 結果の処理
+        if 200 <= status < 300:
+            if VERBOSE:
+                print(f"[{request_id.decode('ascii')}] SUCCESS. Param: {unique_param}, Status: {status}")
+            return "SUCCESS", None
+        else:
+            # 本文のデコードはエラー時のみ、ログに出力する先頭部分に限って行う
+            error_data = response_data[:100].decode('utf-8', errors='replace')
+            return "FAILED", f"[{request_id.decode('ascii')}] FAILED. HTTP Status: {status}, Error: {error_data}"
+
+    except Exception as e:
+        return "CRITICAL ERROR", f"[{request_id.decode('ascii')}] CRITICAL ERROR. Param: {unique_param}, Error: {e}"
+
+
+async def _send_and_record(request_count, connection):
+    """
+    リクエストを送信し、結果を集計するコルーチン
+    """
+    record_result(await send_soap_request_async(request_count, connection))
+
+
+# メイン実行部分
+async def run_load_test_async():
+    """
+    ロードテストを実行するコルーチン。
+    """
+    print(f"Starting load test for {DURATION_SECONDS} seconds against {SERVICE_HOST}:{SERVICE_PORT}...")
+    print(f"Using asyncio ({CONNECTION_LIMIT} connections x pipeline depth {PIPELINE_DEPTH}). Total target rate: {TARGET_RATE} req/sec.")
+
+    log_listener = start_error_logging(logger)
+    loop = asyncio.get_running_loop()
+    connections = [PipelinedConnection() for _ in range(CONNECTION_LIMIT)]
+
+    request_count = 0
+    tasks = set()
+    next_report_time = 1
+
+    # テストの実行 (送信予定時刻はループ開始時刻からの絶対スケジュールで管理し、誤差を蓄積させない)
+    t0 = loop.time()
+    while (loop.time() - t0) < DURATION_SECONDS:
+        request_count += 1
+
+        # 処理中のリクエストが最も少ない接続に割り当てる (応答が遅い接続にリクエストを溜めない)
+        connection = min(connections, key=_in_flight)
+        task = asyncio.create_task(_send_and_record(request_count, connection))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+        # 1秒ごとに途中経過を出力
+        elapsed = loop.time() - t0
+        if elapsed >= next_report_time:
+            print(f"[{elapsed:5.1f}s] Sent: {request_count}, {format_results()}")
+            next_report_time += 1
+
+        # 次のリクエストまでの待機 (レート制御)
+        next_send = t0 + request_count * TARGET_INTERVAL
+        await asyncio.sleep(max(0, next_send - loop.time()))
+
+    # 未完了のリクエストを待機 (タイムアウト付き)
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=SHUTDOWN_TIMEOUT)
+        for task in pending:
+            task.cancel()
+    for connection in connections:
+        connection.close()
+    log_listener.stop()
+
+    actual_duration = loop.time() - t0
+    actual_rate = request_count / actual_duration
+
+    print("\n--- Test Finished ---")
+    print(f"Total Requests Sent: {request_count}")
+    print(f"Results: {format_results()}")
+    print(f"Duration: {actual_duration:.2f} seconds")
+    print(f"Actual Rate: {actual_rate:.2f} requests/sec")
+
+# 実行
+if __name__ == "__main__":
+    asyncio.run(run_load_test_async())
@@ -1,6 +1,6 @@
 # --------------------------------------------------------------------------------------
 # ファイル名: pyApiAtac_mp.py
-# 概要: Python multiprocessingを使用したSOAP負荷テストクライアント。
+# 概要: Python multiprocessing (ワーカープロセスプール) を使用したSOAP負荷テストクライアント。
 # 目的: SOAPサービスへのリクエストの同時実行性（並列性）を検証するために作成。
 #
 # 作成者: Pekokana
@@ -8,7 +8,12 @@
 # バージョン: 1.0.0
 # --------------------------------------------------------------------------------------
 # 実行方法：python pyApiAtac_mp.py
+import collections
+import logging
+import logging.handlers
 import multiprocessing as mp
+import os
+import queue
 import time
 import http.client
 import ssl
@@ -26,6 +31,9 @@ BASE_PARAMETER_VALUE = 1000       # パラメータのベース値
 DURATION_SECONDS = 10             # テスト実行時間（秒）
 TARGET_RATE = 1000                  # １秒間に実行したい目標リクエスト数
 TARGET_INTERVAL = 1.0 / TARGET_RATE # 1リクエストあたりの目標間隔
+WORKER_PROCESSES = os.cpu_count()  # リクエストを送信するワーカープロセス数
+SHUTDOWN_TIMEOUT = 10             # テスト終了後、未完了リクエストを待つ最大秒数
+VERBOSE = False                   # True: リクエストごとの結果を1行ずつ出力 (高負荷時は出力自体が負荷になる)
 
 # --- SOAP XML テンプレート (修正) ---
 # {param_value}: リクエストごとに変わるパラメータ値
@@ -40,61 +48,157 @@ SOAP_ENVELOPE_TEMPLATE = """<?xml version="1.0" encoding="utf-8"?>
   </soap:Body>
 </soap:Envelope>"""
 
-# プロセスごとに実行する関数
+# テンプレートの固定部分は起動時に1度だけ展開し、bytesとして保持する
+# (リクエストごとの format / encode を省くため、可変部分の位置で分割しておく)
+_ENVELOPE_PREFIX, _ENVELOPE_MID, _ENVELOPE_SUFFIX = SOAP_ENVELOPE_TEMPLATE.format(
+    method_name=SOAP_METHOD_NAME,
+    param_value='\x00',
+    request_id_tag='<requestId>\x00</requestId>'
+).encode('utf-8').split(b'\x00')
+
+# --- 固定のHTTPヘッダー (Content-Lengthは送信時にhttp.clientが付与) ---
+SOAP_HEADERS = {
+    "Content-Type": "text/xml; charset=utf-8",
+    "SOAPAction": SOAP_ACTION_HEADER
+}
+
+# --- HTTPS用のSSLコンテキスト (証明書ストアの読み込みを伴うため、接続ごとではなく1度だけ生成) ---
+SSL_CONTEXT = ssl.create_default_context() if IS_HTTPS else None
+
+# --- HTTP接続 (プロセスごとに1本を保持し、keep-aliveで再利用) ---
+_connection = None
+
+def _get_connection():
+    """
+    プロセス内で共有するHTTP接続を取得する関数 (初回呼び出し時に生成)
+    """
+    global _connection
+    if _connection is None:
+        # (http.client は接続時にNagleアルゴリズムを無効化 (TCP_NODELAY) する)
+        if IS_HTTPS:
+            _connection = http.client.HTTPSConnection(SERVICE_HOST, SERVICE_PORT, context=SSL_CONTEXT)
+        else:
+            _connection = http.client.HTTPConnection(SERVICE_HOST, SERVICE_PORT)
+    return _connection
+
+def _reset_connection():
+    """
+    エラー発生時に接続を破棄し、次回のリクエストで再接続させる関数
+    """
+    global _connection
+    if _connection is not None:
+        _connection.close()
+        _connection = None
+
+# --- 識別子の固定部分 (P<プロセスID>-R はプロセス内で変わらないため、プロセスごとに1度だけ生成) ---
+_request_id_prefix = None
+
+def make_request_id(request_count):
+    """
+    P<プロセスID>-R<連番>形式の識別子をbytesで生成する関数
+    """
+    global _request_id_prefix
+    if _request_id_prefix is None:
+        _request_id_prefix = f"P{os.getpid()}-R".encode('ascii')
+    return _request_id_prefix + b"%d" % request_count
+
+def _init_worker():
+    """
+    ワーカープロセスの起動時に1度だけ実行される初期化関数
+    """
+    # プロセス内で再利用するHTTP接続を確立し、識別子の固定部分を用意しておく
+    # (初回リクエストでTCP/TLSハンドシェイクを待たないよう、ここで接続まで済ませる)
+    try:
+        _get_connection().connect()
+    except OSError:
+        # 接続できない場合は破棄し、初回のリクエストで再接続させる
+        _reset_connection()
+    make_request_id(0)
+
+def build_soap_body(unique_param, request_id):
+    """
+    パラメータ値と識別子 (bytes) を埋め込んだSOAPリクエストXMLをbytesで組み立てる関数
+    """
+    return b"".join((
+        _ENVELOPE_PREFIX,
+        b"%d" % unique_param,
+        _ENVELOPE_MID,
+        request_id,
+        _ENVELOPE_SUFFIX
+    ))
+
+# --- 結果の集計 (リクエストごとには出力せず、1秒ごとにまとめて出力する) ---
+results = collections.Counter()
+logger = logging.getLogger(__name__)
+
+def start_error_logging(target_logger):
+    """
+    エラーログの書き出しを別スレッドに任せ、呼び出し側が出力I/Oで待たされないようにする関数
+    """
+    log_queue = queue.SimpleQueue()
+    target_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    target_logger.propagate = False
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+    listener.start()
+    return listener
+
+def record_result(result):
+    """
+    1リクエストの結果 (結果区分, エラーメッセージ) を集計する関数
+    """
+    outcome, message = result
+    results[outcome] += 1
+    if message is not None:
+        logger.error(message)
+
+def format_results():
+    """
+    結果区分ごとの件数を1行の文字列にまとめる関数
+    """
+    return f"SUCCESS: {results['SUCCESS']}, FAILED: {results['FAILED']}, CRITICAL ERROR: {results['CRITICAL ERROR']}"
+
+# ワーカープロセスで実行する関数
 def send_soap_request(request_count):
     """
     SOAPサービスにリクエストを送信する関数 (標準ライブラリのみ使用)
+    結果は (結果区分, エラーメッセージ) のタプルで返し、親プロセスで集計する
     """
-    # multiprocessingの場合はプロセスID (PID) を取得
-    process_id = mp.current_process().pid
-    request_id_value = f"P{process_id}-R{request_count}" # 例: P12345-R10
-    request_id_tag = f"<requestId>{request_id_value}</requestId>" # XMLタグ形式で生成
+    # 1. 識別子の準備 (multiprocessingの場合はワーカーのプロセスID (PID) を含む)
+    request_id = make_request_id(request_count) # 例: b"P12345-R10"
     
     # 2. パラメータ値の準備
     unique_param = BASE_PARAMETER_VALUE + request_count
     
-    # 3. SOAP XMLの組み立て
-    soap_body = SOAP_ENVELOPE_TEMPLATE.format(
-        method_name=SOAP_METHOD_NAME,
-        param_value=unique_param,
-        request_id_tag=request_id_tag # 識別子をXMLに埋め込む
-    ).encode('utf-8')
+    # 3. SOAP XMLの組み立て (識別子は<requestId>タグとしてXMLに埋め込む)
+    soap_body = build_soap_body(unique_param, request_id)
     
-    # 4. HTTP接続の確立
+    # 4. HTTP接続の取得 (既存の接続があれば再利用)
     try:
         # ここからI/O処理
-        if IS_HTTPS:
-            conn = http.client.HTTPSConnection(SERVICE_HOST, SERVICE_PORT, context=ssl.create_default_context())
-        else:
-            conn = http.client.HTTPConnection(SERVICE_HOST, SERVICE_PORT)
-
-        # 5. ヘッダーの定義
-        headers = {
-            "Content-Type": "text/xml; charset=utf-8",
-            "Content-Length": str(len(soap_body)),
-            "SOAPAction": SOAP_ACTION_HEADER
-        }
+        conn = _get_connection()
 
-        # 6. リクエストの送信
-        conn.request("POST", SERVICE_PATH, body=soap_body, headers=headers)
+        # 5. リクエストの送信 (ヘッダーは固定の定義を使用)
+        conn.request("POST", SERVICE_PATH, body=soap_body, headers=SOAP_HEADERS)
         
-        # 7. レスポンスの受信
+        # 6. レスポンスの受信
         response = conn.getresponse()
         
-        # 8. 結果の処理
+        # 7. 結果の処理
+        # 接続は閉じずに再利用するため本文は読み切るが (keep-alive)、文字列へのデコードは必要な場合のみ行う
+        response_data = response.read()
         if 200 <= response.status < 300:
-            response_data = response.read().decode('utf-8')
-            # ログに識別子を出力し、レスポンス本文も確認
-            print(f"[{request_id_value}] SUCCESS. Param: {unique_param}, Status: {response.status}")
-            # print(f"  Response Body Check: {response_data.strip()[:100]}...") # ロギングが多くなるためコメントアウト
+            if VERBOSE:
+                # ログに識別子を出力し、レスポンス本文も確認
+                print(f"[{request_id.decode('ascii')}] SUCCESS. Param: {unique_param}, Status: {response.status}")
+                # print(f"  Response Body Check: {response_data.decode('utf-8').strip()[:100]}...") # ロギングが多くなるためコメントアウト
+            return "SUCCESS", None
         else:
-            error_data = response.read().decode('utf-8')
-            print(f"[{request_id_value}] FAILED. HTTP Status: {response.status}, Error: {error_data[:100]}")
-
-        conn.close()
+            error_data = response_data[:100].decode('utf-8', errors='replace')
+            return "FAILED", f"[{request_id.decode('ascii')}] FAILED. HTTP Status: {response.status}, Error: {error_data}"
 
     except Exception as e:
-        print(f"[{request_id_value}] CRITICAL ERROR. Param: {unique_param}, Error: {e}")
+        _reset_connection()
+        return "CRITICAL ERROR", f"[{request_id.decode('ascii')}] CRITICAL ERROR. Param: {unique_param}, Error: {e}"
 
 # メイン実行部分
 def run_load_test():
@@ -102,43 +206,57 @@ def run_load_test():
     ロードテストを実行する関数。
     """
     print(f"Starting load test for {DURATION_SECONDS} seconds against {SERVICE_HOST}:{SERVICE_PORT}...")
-    print(f"Using multiprocessing. Total target rate: {TARGET_RATE} req/sec.")
+    print(f"Using multiprocessing ({WORKER_PROCESSES} worker processes). Total target rate: {TARGET_RATE} req/sec.")
+    
+    log_listener = start_error_logging(logger)
+    
+    # ワーカープロセスはテスト開始時に1度だけ生成し、全リクエストで使い回す
+    pool = mp.Pool(processes=WORKER_PROCESSES, initializer=_init_worker)
     
-    start_time = time.time()
+    # 時刻はシステム時計の変更の影響を受けない time.monotonic_ns() (整数ナノ秒) で管理する
+    start_ns = time.monotonic_ns()
+    duration_ns = DURATION_SECONDS * 1_000_000_000
     request_count = 0
-    processes = []
+    next_report_ns = start_ns + 1_000_000_000
     
     # テストの実行
-    while (time.time() - start_time) < DURATION_SECONDS:
+    while (time.monotonic_ns() - start_ns) < duration_ns:
         request_count += 1
         
-        iteration_start_time = time.time()
+        # send_soap_requestには連番 (request_count) のみを渡し、結果は親プロセスで集計します
+        pool.apply_async(send_soap_request, (request_count,), callback=record_result)
         
-        # send_soap_requestには連番 (request_count) のみを渡します
-        process = mp.Process(target=send_soap_request, args=(request_count,))
-        processes.append(process)
-        process.start()
+        # 1秒ごとに途中経過を出力
+        now_ns = time.monotonic_ns()
+        if now_ns >= next_report_ns:
+            print(f"[{(now_ns - start_ns) / 1e9:5.1f}s] Sent: {request_count}, {format_results()}")
+            next_report_ns += 1_000_000_000
         
-        # 実行にかかった時間を計算
-        execution_time = time.time() - iteration_start_time
+        # 次のリクエストの送信予定時刻まで待機 (レート制御)
+        # 予定時刻はテスト開始時刻からの絶対値で計算するため、待機誤差や送信処理の時間が蓄積しない
+        next_send_ns = start_ns + request_count * 1_000_000_000 // TARGET_RATE
+        sleep_ns = next_send_ns - time.monotonic_ns()
         
-        # 次のリクエストまでの待機時間を計算 (レート制御)
-        sleep_time = TARGET_INTERVAL - execution_time
-        
-        if sleep_time > 0:
-            time.sleep(sleep_time)
-            
-    # プロセスはスレッドより重いため、joinのタイムアウトは長めが推奨されることがあります
-    for p in processes:
-        p.join(timeout=10) # タイムアウトを10秒に延長
+        if sleep_ns > 0:
+            time.sleep(sleep_ns / 1e9)
             
-    end_time = time.time()
+    # 受付を締め切り、キューに残ったリクエストの送信完了を待つ (タイムアウト付き)
+    # 完了件数は集計結果の合計で判定するため、リクエストごとの AsyncResult は保持しない
+    pool.close()
+    deadline_ns = time.monotonic_ns() + SHUTDOWN_TIMEOUT * 1_000_000_000
+    while sum(results.values()) < request_count and time.monotonic_ns() < deadline_ns:
+        time.sleep(0.1)
+    # 全ワーカーを1度に停止し、応答待ちのまま残ったリクエストがあっても終了を待たない
+    pool.terminate()
+    pool.join()
+    log_listener.stop()
     
-    actual_duration = end_time - start_time
+    actual_duration = (time.monotonic_ns() - start_ns) / 1e9
     actual_rate = request_count / actual_duration
     
     print("\n--- Test Finished ---")
     print(f"Total Requests Sent: {request_count}")
+    print(f"Results: {format_results()}")
     print(f"Duration: {actual_duration:.2f} seconds")
     print(f"Actual Rate: {actual_rate:.2f} requests/sec")
 
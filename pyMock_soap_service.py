@@ -10,13 +10,18 @@
 # 作成日: 2025-11-30
 # バージョン: 1.0.0
 # --------------------------------------------------------------------------------------
+import collections
+import http
 import http.server
+import logging
+import logging.handlers
+import queue
 import socketserver
-import xml.etree.ElementTree as ET
+import threading
+import xml.parsers.expat
 from urllib.parse import urlparse
+import re
 import time
-import datetime # datetimeモジュールを追加
-# import re # reモジュールは不要になりました
 
 # --- サービス設定 (テストツールと一致させる必要があります) ---
 HOST = "127.0.0.1"
@@ -25,10 +30,53 @@ SERVICE_PATH = "/soap/endpoint"
 SOAP_METHOD_NAME = 'ApiMethod'
 PARAM_TAG_NAME = 'requestParameter'
 REQUEST_ID_TAG_NAME = 'requestId'
+LISTEN_BACKLOG = 512   # 接続待ちキューの長さ (負荷テスト開始時に多数の接続が同時に届くため大きめに設定)
+
+# --- ログ設定 ---
+VERBOSE = False      # True: リクエストごとに [OK] 行を出力 (高負荷時は出力自体が負荷になる)
+STATS_INTERVAL = 1   # 処理件数の集計結果を出力する間隔（秒）
 
 # XMLの名前空間を定義 (レスポンス構築とリクエスト解析に使用)
 TARGET_NAMESPACE = 'http://tempuri.org/'
 SOAP_NAMESPACE = 'http://schemas.xmlsoap.org/soap/envelope/'
+# クライアント (pyApiAtac_mp.py) のSOAP XMLテンプレートで使用している名前空間
+CLIENT_TARGET_NAMESPACE = 'http://ApiAtackDriverExampleProgram.com/'
+# True: 名前空間なしのメソッド・パラメータタグも受け付ける (互換モード)
+# (正規表現の高速経路は名前空間付きの固定形式にのみ一致するため、この設定は全リクエストに適用される)
+ALLOW_UNQUALIFIED_TAGS = False
+
+# リクエスト解析で使用する名前空間付きタグ名 (リクエストごとに組み立てないよう事前に生成)
+# expatは名前空間URIとローカル名を NAMESPACE_SEPARATOR で連結したタグ名をハンドラに渡す
+NAMESPACE_SEPARATOR = " "
+BODY_TAG = f"{SOAP_NAMESPACE}{NAMESPACE_SEPARATOR}Body"
+METHOD_TAG = f"{CLIENT_TARGET_NAMESPACE}{NAMESPACE_SEPARATOR}{SOAP_METHOD_NAME}"
+PARAM_TAG = f"{CLIENT_TARGET_NAMESPACE}{NAMESPACE_SEPARATOR}{PARAM_TAG_NAME}"
+REQUEST_ID_TAG = f"{CLIENT_TARGET_NAMESPACE}{NAMESPACE_SEPARATOR}{REQUEST_ID_TAG_NAME}"
+# 受け付けるタグ名 (名前空間なしのタグは互換モードの場合のみ)
+METHOD_TAGS = {METHOD_TAG, SOAP_METHOD_NAME} if ALLOW_UNQUALIFIED_TAGS else {METHOD_TAG}
+PARAM_TAGS = {PARAM_TAG, PARAM_TAG_NAME} if ALLOW_UNQUALIFIED_TAGS else {PARAM_TAG}
+REQUEST_ID_TAGS = {REQUEST_ID_TAG, REQUEST_ID_TAG_NAME} if ALLOW_UNQUALIFIED_TAGS else {REQUEST_ID_TAG}
+
+# 固定形式のリクエストから2つの値だけを取り出すための正規表現 (XMLツリーを構築しない高速経路)
+# クライアント (pyApiAtac_mp.py) が送信するエンベロープ全体 (XML宣言・Envelope・Body・メソッド要素) と
+# fullmatch で照合し、要素間の空白以外が1文字でも異なるリクエストはXMLとしての解析 (構造の検証) に回す
+_XML_SPACE = r'[ \t\r\n]*'
+# 値はそのままUTF-8のレスポンスに埋め込むため、印字可能なASCII文字 (マークアップ・文字参照を除く) のみ一致させる
+# (非ASCII文字・制御文字を含む値はexpatでデコード・検証させる)
+_XML_VALUE = r'([^<&\x00-\x1f\x7f-\xff]*)'
+SOAP_REQUEST_RE = re.compile((
+    r'<\?xml version="1\.0" encoding="utf-8"\?>' + _XML_SPACE +
+    r'<soap:Envelope xmlns:xsi="http://www\.w3\.org/2001/XMLSchema-instance"'
+    r' xmlns:xsd="http://www\.w3\.org/2001/XMLSchema"'
+    rf' xmlns:soap="{re.escape(SOAP_NAMESPACE)}">' + _XML_SPACE +
+    r'<soap:Body>' + _XML_SPACE +
+    rf'<{SOAP_METHOD_NAME} xmlns="{re.escape(CLIENT_TARGET_NAMESPACE)}">' + _XML_SPACE +
+    rf'<{PARAM_TAG_NAME}>{_XML_VALUE}</{PARAM_TAG_NAME}>' + _XML_SPACE +
+    rf'<{REQUEST_ID_TAG_NAME}>{_XML_VALUE}</{REQUEST_ID_TAG_NAME}>' + _XML_SPACE +
+    rf'</{SOAP_METHOD_NAME}>' + _XML_SPACE +
+    r'</soap:Body>' + _XML_SPACE +
+    r'</soap:Envelope>' + _XML_SPACE
+).encode('utf-8'))
 
 # --- SOAP レスポンス テンプレート (修正) ---
 # {received_request_id} にクライアントから受け取った識別子を埋め込む
@@ -46,97 +94,238 @@ SOAP_RESPONSE_TEMPLATE = """<?xml version="1.0" encoding="utf-8"?>
     </soap:Body>
 </soap:Envelope>"""
 
+# 固定部分 (メソッド名・名前空間) は起動時に1度だけ展開し、可変部分の位置で分割したbytesとして保持する
+_RESPONSE_PREFIX, _RESPONSE_MID_TIMESTAMP, _RESPONSE_MID_REQUEST_ID, _RESPONSE_SUFFIX = SOAP_RESPONSE_TEMPLATE.format(
+    method_name=SOAP_METHOD_NAME,
+    target_namespace=TARGET_NAMESPACE,
+    received_param='\x00',
+    timestamp='\x00',
+    received_request_id='\x00'
+).encode('utf-8').split(b'\x00')
+
+
+# --- 処理件数の集計 (リクエストごとには出力せず、一定間隔でまとめて出力する) ---
+logger = logging.getLogger(__name__)
+_stats = collections.Counter()
+_stats_lock = threading.Lock()
+
+
+def record_request(outcome):
+    """応答結果 (OK / ERROR) を1件集計する関数"""
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def _report_stats():
+    """集計結果をSTATS_INTERVALごとに出力する関数 (専用スレッドで実行)"""
+    last = collections.Counter()
+    while True:
+        time.sleep(STATS_INTERVAL)
+        with _stats_lock:
+            current = _stats.copy()
+        if current != last:
+            print(f"[Stats] OK: {current['OK']} (+{current['OK'] - last['OK']}), "
+                  f"ERROR: {current['ERROR']} (+{current['ERROR'] - last['ERROR']})")
+            last = current
+
+
+def start_logging():
+    """
+    エラーログをキュー経由で別スレッドから出力する設定と、集計結果の出力スレッドを開始する関数
+    (ハンドラのスレッドがコンソール出力で待たされないようにするため)
+    """
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.propagate = False
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+    listener.start()
+    threading.Thread(target=_report_stats, daemon=True).start()
+    return listener
+
+
+# --- HTTPレスポンスのContent-Type ---
+XML_CONTENT_TYPE = b"text/xml; charset=utf-8"
+HTML_CONTENT_TYPE = b"text/html"
+
+# ステータスコードごとのステータス行 (リクエストごとに理由フレーズを引いて組み立てないよう事前に生成)
+STATUS_LINES = {
+    status.value: b"HTTP/1.1 %d %s\r\n" % (status.value, status.phrase.encode('ascii'))
+    for status in http.HTTPStatus
+}
+
+
+def build_http_response(code, content_type, body, close=False):
+    """
+    ステータス行・ヘッダー・本文を1つのbytesにまとめる関数
+    (1回の書き込み (システムコール) でレスポンス全体を送信するため)
+    """
+    return b"".join((
+        STATUS_LINES[code],
+        b"Content-Type: ", content_type,
+        b"\r\nContent-Length: ", b"%d" % len(body),
+        b"\r\nConnection: close\r\n\r\n" if close else b"\r\n\r\n",
+        body
+    ))
+
+
+def format_timestamp(timestamp_ms):
+    """
+    UNIXタイムスタンプ (ミリ秒) をログ用の人間が読める形式に変換する関数
+    (ログを出力する場合のみ呼び出す)
+    """
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp_ms // 1000)) + f".{timestamp_ms % 1000:03d}"
+
+
+def build_soap_response(received_param, timestamp_ms, received_request_id):
+    """
+    受け取ったパラメータ値・リクエストID (bytes) とタイムスタンプ (ミリ秒) を埋め込んだSOAPレスポンスXMLをbytesで組み立てる関数
+    """
+    return b"".join((
+        _RESPONSE_PREFIX,
+        received_param,
+        _RESPONSE_MID_TIMESTAMP,
+        b"%d" % timestamp_ms,
+        _RESPONSE_MID_REQUEST_ID,
+        received_request_id,
+        _RESPONSE_SUFFIX
+    ))
+
+
+def parse_soap_request(post_data):
+    """
+    SOAPリクエストXMLからパラメータ値とリクエストIDをbytesのまま取り出す関数
+    (リクエストIDが見つからない場合は None を返す)
+    """
+    # 高速経路: 本文全体がクライアントの固定形式と一致する場合のみ、正規表現で2つの値を直接取り出す
+    # (値はデコードせず、そのままレスポンスに埋め込む)
+    request_match = SOAP_REQUEST_RE.fullmatch(post_data)
+    if request_match is not None:
+        return request_match.group(1), request_match.group(2) or None
+
+    # 想定外の形式 (名前空間プレフィックス付き・リクエストIDなしなど) の場合はXMLとして解析する
+    return _parse_soap_request_xml(post_data)
+
+
+# SOAP Body / メソッド / パラメータ要素の深さ (ルート要素 = 1)
+BODY_DEPTH = 2
+METHOD_DEPTH = 3
+FIELD_DEPTH = 4
+
+
+class _SOAPRequestSAXHandler:
+    """
+    expatから要素の開始・終了・文字データを受け取り、
+    Envelope/Body/メソッド/パラメータの階層を検証しながら値を取り出すハンドラ
+    """
+
+    def __init__(self):
+        self.depth = 0               # 現在の要素の深さ
+        self.body_found = False
+        self.method_found = False
+        self.param = None
+        self.request_id = None
+        self._in_body = False        # 最初のSOAP Body要素の内側か
+        self._in_method = False      # 最初のメソッド要素の内側か
+        self._field = None           # 値を取り出し中の要素 ("param" / "request_id")
+        self._text = []
+
+    def start_element(self, name, attrs):
+        self.depth += 1
+        if self._field is not None:
+            # 値の要素に子要素がある場合、値は最初の子要素より前の文字データのみ (ElementTreeの .text と同じ)
+            if self.depth == FIELD_DEPTH + 1 and getattr(self, self._field) is None:
+                setattr(self, self._field, "".join(self._text))
+        elif self._in_method:
+            # 3. メソッド直下のパラメータ・リクエストID要素 (それぞれ最初の1つのみ)
+            if self.depth == FIELD_DEPTH:
+                if name in PARAM_TAGS and self.param is None:
+                    self._field = "param"
+                elif name in REQUEST_ID_TAGS and self.request_id is None:
+                    self._field = "request_id"
+                self._text.clear()
+        elif self._in_body:
+            # 2. Body直下のメソッド要素 (最初の1つのみ)
+            if self.depth == METHOD_DEPTH and name in METHOD_TAGS and not self.method_found:
+                self.method_found = self._in_method = True
+        elif self.depth == BODY_DEPTH and name == BODY_TAG and not self.body_found:
+            # 1. ルート (Envelope) 直下のSOAP Body要素 (最初の1つのみ)
+            self.body_found = self._in_body = True
+
+    def end_element(self, name):
+        if self._field is not None:
+            if self.depth == FIELD_DEPTH:
+                if getattr(self, self._field) is None:
+                    setattr(self, self._field, "".join(self._text))
+                self._field = None
+        elif self._in_method and self.depth == METHOD_DEPTH:
+            self._in_method = False
+        elif self._in_body and self.depth == BODY_DEPTH:
+            self._in_body = False
+        self.depth -= 1
+
+    def character_data(self, data):
+        if self._field is not None and self.depth == FIELD_DEPTH:
+            self._text.append(data)
+
+
+def _parse_soap_request_xml(post_data):
+    """
+    SOAPリクエストXMLをexpat (SAX形式) で解析し、構造を検証しながら値を取り出す関数
+    """
+    # ツリーを構築する ET.fromstring と異なり、要素オブジェクトを生成せず先頭から順に読み進める
+    # (値を取り出した後も文書の最後まで解析し、整形式でないXMLは ExpatError として拒否する)
+    handler = _SOAPRequestSAXHandler()
+    parser = xml.parsers.expat.ParserCreate(namespace_separator=NAMESPACE_SEPARATOR)
+    parser.buffer_text = True
+    parser.StartElementHandler = handler.start_element
+    parser.EndElementHandler = handler.end_element
+    parser.CharacterDataHandler = handler.character_data
+    parser.Parse(post_data, True)
+
+    if not handler.body_found:
+        raise ValueError("SOAP Body element not found.")
+    if not handler.method_found:
+        raise ValueError(f"Method tag <{SOAP_METHOD_NAME}> not found with namespaces.")
+    if handler.param is None:
+        raise ValueError(f"Parameter tag <{PARAM_TAG_NAME}> not found.")
+
+    received_request_id = handler.request_id.encode('utf-8') if handler.request_id else None
+    return handler.param.encode('utf-8'), received_request_id
+
 
 class SOAPHandler(http.server.BaseHTTPRequestHandler):
     """
     HTTPリクエストを処理し、SOAPレスポンスを返すハンドラ
     """
-    SOAP_NAMESPACE = 'http://schemas.xmlsoap.org/soap/envelope/'
-    TARGET_NAMESPACE = 'http://tempuri.org/'
+    # HTTP/1.1で応答し、クライアントの接続を閉じずに再利用させる (keep-alive)
+    protocol_version = "HTTP/1.1"
+    # keep-alive接続ではヘッダーと本文の書き込みがNagleアルゴリズムで遅延するため無効化
+    disable_nagle_algorithm = True
 
     def do_POST(self):
-        # 1. URLパスのチェック
+        # 1. リクエストボディの読み込み
+        # (keep-alive接続では、エラー応答の場合も本文を読み切らないと次のリクエストとして解釈されてしまう)
+        content_length = int(self.headers['Content-Length'])
+        post_data = self.rfile.read(content_length)
+
+        # 2. URLパスのチェック
         parsed_url = urlparse(self.path)
         if parsed_url.path != SERVICE_PATH:
             self._send_error(404, "Not Found")
             return
-
-        # 2. リクエストボディの読み込み
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
         
         # 3. SOAP XMLの解析
         received_param = None
-        received_request_id = "N/A" # 識別子を初期化
-        current_time_stamp = time.time() # UNIXタイムスタンプを取得
-        readable_time = datetime.datetime.fromtimestamp(current_time_stamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] # 人間が読める形式に変換
+        received_request_id = b"N/A" # 識別子を初期化
+        current_time_ms = time.time_ns() // 1_000_000 # UNIXタイムスタンプ (ミリ秒) を取得
         
         try:
-            # XML文字列をElementTreeオブジェクトにパース
-            root = ET.fromstring(post_data)
-            
-            # クライアントのSOAP XMLテンプレートから名前空間を定義
-            CLIENT_TARGET_NAMESPACE = 'http://ApiAtackDriverExampleProgram.com/'
-            
-            # 3a. SOAP Body要素の検索
-            body_xpath = f"{{{self.SOAP_NAMESPACE}}}Body"
-            body_element = root.find(body_xpath)
-            if body_element is None:
-                raise ValueError("SOAP Body element not found.")
-
-            # 3b. メソッド要素の検索
-            method_xpath_client = f"{{{CLIENT_TARGET_NAMESPACE}}}{SOAP_METHOD_NAME}"
-            method_element = body_element.find(method_xpath_client)
-            if method_element is None:
-                method_element = body_element.find(SOAP_METHOD_NAME)
-            if method_element is None:
-                raise ValueError(f"Method tag <{SOAP_METHOD_NAME}> not found with namespaces.")
-
-            # 3c. パラメータ要素の検索
-            param_element = method_element.find(f"{{{CLIENT_TARGET_NAMESPACE}}}{PARAM_TAG_NAME}")
-            if param_element is None:
-                param_element = method_element.find(PARAM_TAG_NAME)
-            if param_element is None:
-                raise ValueError(f"Parameter tag <{PARAM_TAG_NAME}> not found.")
-
-            received_param = param_element.text
-            
-            # # 3d. リクエストID要素の検索
-            # request_id_element = method_element.find(f"{{{CLIENT_TARGET_NAMESPACE}}}{REQUEST_ID_TAG_NAME}")
-            # if request_id_element is None:
-            #     request_id_element = method_element.find(REQUEST_ID_TAG_NAME)
-            
-            # if request_id_element and request_id_element.text:
-            #     received_request_id = request_id_element.text
-
-            # 3d. リクエストID要素の検索 (より堅牢な検索に修正) 
-            # 1. 名前空間付きで検索 (pyApiAtac.pyのリクエスト構造と一致するはず)
-            request_id_element = method_element.find(f"{{{CLIENT_TARGET_NAMESPACE}}}{REQUEST_ID_TAG_NAME}")
-            
-            # 2. 見つからなかった場合、名前空間なしで検索
-            if request_id_element is None:
-                request_id_element = method_element.find(REQUEST_ID_TAG_NAME)
-            
-            # 3. リクエストIDが他の名前空間を持つ可能性がある場合（例えば、リクエストIDがデフォルト名前空間なしで定義されている場合）
-            # ここは必須ではありませんが、より汎用的にするためにコメントアウトで例示
-            # if request_id_element is None:
-            #     # 全ての子要素をイテレートしてタグ名で確認
-            #     for child in method_element:
-            #         # タグ名がREQUEST_ID_TAG_NAME ('requestId')で終わるか確認
-            #         if child.tag.endswith(REQUEST_ID_TAG_NAME):
-            #             request_id_element = child
-            #             break
-            
-            if request_id_element is not None and request_id_element.text is not None:
-                received_request_id = request_id_element.text
-            # else:
-            #     # デバッグ用: なぜ見つからなかったかをログに出す
-            #     print(f"DEBUG: requestId tag not found. Children tags of ApiMethod: {[c.tag for c in method_element]}")
-
-
+            received_param, parsed_request_id = parse_soap_request(post_data)
+            if parsed_request_id is not None:
+                received_request_id = parsed_request_id
         except Exception as e:
             # XMLパースエラーが発生した場合
-            print(f"[{readable_time}] XML Parsing Error: {e}")
+            logger.error(f"[{format_timestamp(current_time_ms)}] XML Parsing Error: {e}")
             self._send_error(400, f"Bad Request: XML Parsing failed. Error: {e}")
             return
         
@@ -144,39 +333,51 @@ class SOAPHandler(http.server.BaseHTTPRequestHandler):
         # 処理シミュレーションのためのわずかな遅延
         # time.sleep(0.001) 
         
-        response_body = SOAP_RESPONSE_TEMPLATE.format(
-            method_name=SOAP_METHOD_NAME,
-            target_namespace=self.TARGET_NAMESPACE,
-            received_param=received_param,
-            timestamp=current_time_stamp,
-            received_request_id=received_request_id 
-        ).encode('utf-8')
+        response_body = build_soap_response(received_param, current_time_ms, received_request_id)
 
-        # 5. レスポンスの送信
-        self.send_response(200)
-        self.send_header("Content-type", "text/xml; charset=utf-8")
-        self.send_header("Content-Length", str(len(response_body)))
-        self.end_headers()
-        self.wfile.write(response_body)
+        # 5. レスポンスの送信 (ステータス行・ヘッダー・本文をまとめて1回で書き込む)
+        self.wfile.write(build_http_response(200, XML_CONTENT_TYPE, response_body, close=self.close_connection))
 
-        # ログ出力
-        print(f"[{readable_time}] [OK] Request ID: {received_request_id}, Param: {received_param}")
+        # 集計・ログ出力
+        record_request("OK")
+        if VERBOSE:
+            print(f"[{format_timestamp(current_time_ms)}] [OK] Request ID: {received_request_id.decode('utf-8', errors='replace')}, Param: {received_param.decode('utf-8', errors='replace')}")
 
+    def log_message(self, format, *args):
+        """標準のアクセスログ (リクエストごとの標準エラー出力) は出力しない"""
+        pass
+
+    def log_error(self, format, *args):
+        """不正なリクエスト行などのエラーのみロガーへ出力する"""
+        logger.error(format % args)
 
     def _send_error(self, code, message):
         """エラー応答を送信するヘルパー関数"""
-        self.send_response(code)
-        self.send_header("Content-type", "text/html")
-        self.end_headers()
-        self.wfile.write(f"<h1>{code} {message}</h1>".encode('utf-8'))
-        print(f"[ERROR] Sent {code} response.")
+        error_body = f"<h1>{code} {message}</h1>".encode('utf-8')
+        self.wfile.write(build_http_response(code, HTML_CONTENT_TYPE, error_body, close=self.close_connection))
+        record_request("ERROR")
+        logger.error(f"[ERROR] Sent {code} response.")
+
+
+class SOAPServer(socketserver.ThreadingTCPServer):
+    """
+    負荷テスト向けに設定を調整したサーバー
+    (Nagleアルゴリズムの無効化 (TCP_NODELAY) は SOAPHandler 側で接続ごとに設定)
+    """
+    # keep-alive接続を保持したままでも Ctrl+C で停止できるようにする
+    daemon_threads = True
+    # 既定値 (5) では同時に届いた接続要求が溢れ、クライアント側で再送待ちが発生するため拡大
+    request_queue_size = LISTEN_BACKLOG
+    # 停止直後 (TIME_WAIT中) でも同じポートで再起動できるようにする (SO_REUSEADDR)
+    allow_reuse_address = True
 
 
 def run_mock_service():
     """モックSOAPサービスを起動する関数"""
+    log_listener = start_logging()
     # ThreadingTCPServerで同時接続に対応
     try:
-        with socketserver.ThreadingTCPServer((HOST, PORT), SOAPHandler) as httpd:
+        with SOAPServer((HOST, PORT), SOAPHandler) as httpd:
             print(f"--- Mock SOAP Service Started ---")
             print(f"Listening on http://{HOST}:{PORT}{SERVICE_PATH}")
             print(f"Press Ctrl+C to stop.")
@@ -185,8 +386,8 @@ def run_mock_service():
         print("\n--- Mock SOAP Service Stopped ---")
     except Exception as e:
         print(f"\nServer error: {e}")
+    finally:
+        log_listener.stop()
 
 if __name__ == "__main__":
-    # XML解析時に発生する可能性のある問題を回避するため、名前空間を登録しておきます
-    ET.register_namespace('', TARGET_NAMESPACE)
     run_mock_service()
\ No newline at end of file
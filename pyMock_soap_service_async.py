@@ -0,0 +1,147 @@
+# --------------------------------------------------------------------------------------
+# ファイル名: pyMock_soap_service_async.py
+# 概要: Python asyncioを使用したシンプルなSOAPモックサーバー。
+# 目的: 接続ごとにスレッドを生成せず、1スレッドのイベントループで
+#       負荷テストクライアントからの大量の同時接続を受け付けるために使用。
+#
+# 技術詳細: 標準ライブラリの asyncio.start_server で HTTP/1.1 (keep-alive) を直接処理。
+#           リクエスト解析・レスポンス組み立ては pyMock_soap_service.py と共通。
+#
+# 作成者: Pekokana
+# 作成日: 2025-11-30
+# バージョン: 1.0.0
+# --------------------------------------------------------------------------------------
+import asyncio
+import time
+from urllib.parse import urlparse
+
+from pyMock_soap_service import (
+    HOST,
+    HTML_CONTENT_TYPE,
+    LISTEN_BACKLOG,
+    PORT,
+    SERVICE_PATH,
+    VERBOSE,
+    XML_CONTENT_TYPE,
+    build_http_response,
+    build_soap_response,
+    format_timestamp,
+    logger,
+    parse_soap_request,
+    record_request,
+    start_logging,
+)
+
+
+def _build_error_response(code, message, close=False):
+    """エラー応答を組み立てるヘルパー関数"""
+    record_request("ERROR")
+    logger.error(f"[ERROR] Sent {code} response.")
+    return build_http_response(code, HTML_CONTENT_TYPE, f"<h1>{code} {message}</h1>".encode('utf-8'), close=close)
+
+
+def handle_soap_request(method, path, post_data, close=False):
+    """
+    1件のHTTPリクエストを処理し、送信するレスポンスをbytesで返す関数
+    (close=True の場合は応答後に接続を閉じるため、Connection: close ヘッダーを付与する)
+    """
+    if method != b"POST":
+        return _build_error_response(501, "Unsupported method", close)
+
+    # 1. URLパスのチェック
+    parsed_url = urlparse(path.decode('latin-1'))
+    if parsed_url.path != SERVICE_PATH:
+        return _build_error_response(404, "Not Found", close)
+
+    # 2. SOAP XMLの解析
+    received_request_id = b"N/A" # 識別子を初期化
+    current_time_ms = time.time_ns() // 1_000_000 # UNIXタイムスタンプ (ミリ秒) を取得
+
+    try:
+        received_param, parsed_request_id = parse_soap_request(post_data)
+        if parsed_request_id is not None:
+            received_request_id = parsed_request_id
+    except Exception as e:
+        # XMLパースエラーが発生した場合
+        logger.error(f"[{format_timestamp(current_time_ms)}] XML Parsing Error: {e}")
+        return _build_error_response(400, f"Bad Request: XML Parsing failed. Error: {e}", close)
+
+    # 3. レスポンスの組み立て
+    response_body = build_soap_response(received_param, current_time_ms, received_request_id)
+
+    # 集計・ログ出力
+    record_request("OK")
+    if VERBOSE:
+        print(f"[{format_timestamp(current_time_ms)}] [OK] Request ID: {received_request_id.decode('utf-8', errors='replace')}, Param: {received_param.decode('utf-8', errors='replace')}")
+
+    return build_http_response(200, XML_CONTENT_TYPE, response_body, close=close)
+
+
+async def handle_connection(reader, writer):
+    """
+    1本のクライアント接続を処理するコルーチン (keep-aliveで複数リクエストを順に処理)
+    """
+    try:
+        while True:
+            # 1. リクエスト行の読み込み
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, path, version = request_line.split(None, 2)
+
+            # 2. ヘッダーの読み込み
+            content_length = 0
+            keep_alive = version.strip() == b"HTTP/1.1"
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.partition(b":")
+                name = name.strip().lower()
+                if name == b"content-length":
+                    content_length = int(value.strip())
+                elif name == b"connection":
+                    keep_alive = value.strip().lower() != b"close"
+
+            # 3. リクエストボディの読み込みと応答 (接続を閉じる場合はレスポンスでクライアントに通知する)
+            post_data = await reader.readexactly(content_length)
+            writer.write(handle_soap_request(method, path, post_data, close=not keep_alive))
+            await writer.drain()
+
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        # クライアント側で接続が切断された場合
+        pass
+    except ValueError:
+        # リクエスト行・ヘッダーの形式が不正な場合
+        writer.write(_build_error_response(400, "Bad Request", close=True))
+    finally:
+        writer.close()
+
+
+async def run_mock_service_async():
+    """モックSOAPサービスを起動するコルーチン"""
+    # asyncioはTCP接続ごとにNagleアルゴリズムを無効化 (TCP_NODELAY) し、POSIXではSO_REUSEADDRも既定で設定する
+    server = await asyncio.start_server(handle_connection, HOST, PORT, backlog=LISTEN_BACKLOG)
+    async with server:
+        print(f"--- Mock SOAP Service (asyncio) Started ---")
+        print(f"Listening on http://{HOST}:{PORT}{SERVICE_PATH}")
+        print(f"Press Ctrl+C to stop.")
+        await server.serve_forever()
+
+
+def run_mock_service():
+    """モックSOAPサービスを起動する関数"""
+    log_listener = start_logging()
+    try:
+        asyncio.run(run_mock_service_async())
+    except KeyboardInterrupt:
+        print("\n--- Mock SOAP Service Stopped ---")
+    except Exception as e:
+        print(f"\nServer error: {e}")
+    finally:
+        log_listener.stop()
+
+if __name__ == "__main__":
+    run_mock_service()